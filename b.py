@@ -1,11 +1,14 @@
 import streamlit as st
 import pandas as pd
-import re
-import math
 import hashlib
+import hmac
 import os
-from sklearn.ensemble import RandomForestClassifier
+import io
+import uuid
 from datetime import datetime
+import pyarrow as pa
+import pyarrow.parquet as pq
+from dna_features import encode_sequence, extract_all_features
 
 # ------------------------- PAGE CONFIG --------------------------
 st.set_page_config(
@@ -36,45 +39,115 @@ st.markdown("""
 # ------------------------- AUTHENTICATION --------------------------
 USER_FILE = "users.csv"
 HISTORY_DIR = "history"
-
-def hash_password(password):
-    return hashlib.sha256(password.encode()).hexdigest()
+HISTORY_DTYPES = {
+    "Filename": "string",
+    "Timestamp": "string",
+    "Perplexity": "float64",
+    "G-Quadruplex": "int32",
+    "Z-DNA": "int32",
+    "Cruciform": "int32",
+    "TATA-Box": "int32",
+    "Direct Repeats": "int32",
+    "Sequence Length": "int32",
+    "Prediction": "int32",
+}
+
+PBKDF2_ITERATIONS = 200_000
+
+def hash_password(password, salt=None, iterations=PBKDF2_ITERATIONS):
+    if salt is None:
+        salt = os.urandom(16)
+    digest = hashlib.pbkdf2_hmac("sha256", password.encode(), salt, iterations)
+    return f"pbkdf2_sha256${iterations}${salt.hex()}${digest.hex()}"
+
+def verify_password(password, stored):
+    if stored.startswith("pbkdf2_sha256$"):
+        _, iterations, salt, _ = stored.split("$")
+        candidate = hash_password(password, bytes.fromhex(salt), int(iterations))
+    else:
+        # Accounts registered before salted hashes were introduced
+        candidate = hashlib.sha256(password.encode()).hexdigest()
+    return hmac.compare_digest(candidate, stored)
+
+# Only the newest version of the file is ever asked for again
+@st.cache_data(max_entries=2)
+def _read_users(version):
+    df = pd.read_csv(USER_FILE, usecols=["username", "password"], dtype="string", engine="pyarrow")
+    return dict(zip(df.username, df.password))
 
 def load_users():
     if not os.path.exists(USER_FILE):
         return {}
-    df = pd.read_csv(USER_FILE)
-    return dict(zip(df.username, df.password))
+    # Appends always grow the file, so (mtime, size) changes with every registration
+    # even when two land within the same mtime tick
+    stat = os.stat(USER_FILE)
+    return _read_users((stat.st_mtime_ns, stat.st_size))
 
 def save_user(username, password):
     hashed = hash_password(password)
     df = pd.DataFrame({"username": [username], "password": [hashed]})
-    if os.path.exists(USER_FILE):
-        df_existing = pd.read_csv(USER_FILE)
-        df = pd.concat([df_existing, df], ignore_index=True)
-    df.to_csv(USER_FILE, index=False)
+    df.to_csv(USER_FILE, mode="a", header=not os.path.exists(USER_FILE), index=False)
 
 def authenticate(username, password, users):
-    return users.get(username) == hash_password(password)
+    stored = users.get(username)
+    return isinstance(stored, str) and verify_password(password, stored)
+
+def _write_history(history_dir, entry):
+    if entry.empty:
+        return
+    # Partitioned by day; file names start with the timestamp so they sort chronologically
+    table = pa.Table.from_pandas(entry.assign(date=entry["Timestamp"].str[:8]), preserve_index=False)
+    pq.write_to_dataset(
+        table,
+        root_path=history_dir,
+        partition_cols=["date"],
+        basename_template=f"{entry['Timestamp'].iloc[-1]}-{uuid.uuid4().hex}-{{i}}.parquet",
+    )
+
+def _history_dir(username):
+    # A digest is always one path segment, so no username can reach another user's
+    # directory or anything outside HISTORY_DIR
+    return os.path.join(HISTORY_DIR, hashlib.sha256(username.encode()).hexdigest())
+
+def _migrate_csv_history(username, history_dir):
+    legacy_file = os.path.join(HISTORY_DIR, f"{username}_history.csv")
+    # The old CSV name was built from the raw username, so only follow it while it
+    # stays a plain file directly inside HISTORY_DIR
+    if os.sep in username or (os.altsep and os.altsep in username):
+        return
+    if os.path.dirname(os.path.normpath(legacy_file)) != os.path.normpath(HISTORY_DIR):
+        return
+    if os.path.isfile(legacy_file):
+        _write_history(history_dir, pd.read_csv(legacy_file, dtype=HISTORY_DTYPES, engine="pyarrow"))
+        os.remove(legacy_file)
 
 def log_user_history(username, filename, df):
-    os.makedirs(HISTORY_DIR, exist_ok=True)
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    history_file = os.path.join(HISTORY_DIR, f"{username}_history.csv")
-    df_copy = df.copy()
-    df_copy.insert(0, "Filename", filename)
-    df_copy.insert(1, "Timestamp", timestamp)
-
-    if os.path.exists(history_file):
-        df_existing = pd.read_csv(history_file)
-        df_copy = pd.concat([df_existing, df_copy], ignore_index=True)
-
-    df_copy.to_csv(history_file, index=False)
+    history_dir = _history_dir(username)
+    # assign() only allocates the two metadata columns instead of copying the whole frame
+    entry = df.assign(Filename=filename, Timestamp=timestamp)[["Filename", "Timestamp", *df.columns]]
+    _write_history(history_dir, entry)
+
+def _history_files(history_dir):
+    # Exactly the files _write_history creates: one date=... level, then Parquet files
+    return sorted(
+        entry.path
+        for partition in os.scandir(history_dir) if partition.is_dir() and partition.name.startswith("date=")
+        for entry in os.scandir(partition.path) if entry.is_file() and entry.name.endswith(".parquet")
+    )
+
+@st.cache_data(max_entries=32)
+def _read_history(files):
+    # Keyed on the file list: every write adds a uniquely named file
+    df = pq.read_table(list(files), columns=list(HISTORY_DTYPES)).to_pandas()
+    return df.sort_values("Timestamp", kind="stable", ignore_index=True)
 
 def load_user_history(username):
-    history_file = os.path.join(HISTORY_DIR, f"{username}_history.csv")
-    if os.path.exists(history_file):
-        return pd.read_csv(history_file)
+    history_dir = _history_dir(username)
+    _migrate_csv_history(username, history_dir)
+    files = _history_files(history_dir) if os.path.isdir(history_dir) else []
+    if files:
+        return _read_history(tuple(files))
     else:
         return pd.DataFrame()
 
@@ -87,53 +160,40 @@ if not st.session_state.logged_in:
 else:
     page = st.sidebar.radio("Choose Page", ["🏠 Home", "📂 Upload & Analyze", "📊 Results", "📅 Download Report", "📂 History", "📞 Contact", "🚪 Logout"])
 
-# ------------------------- FEATURE EXTRACTION --------------------------
-def calculate_perplexity(sequence, k=3):
-    kmers = [sequence[i:i + k] for i in range(len(sequence) - k + 1)]
-    kmer_counts = pd.Series(kmers).value_counts()
-    total = sum(kmer_counts)
-    probs = kmer_counts / total
-    entropy = -sum(p * math.log2(p) for p in probs)
-    return 2 ** entropy
-
-def detect_g_quadruplex(seq):
-    return len(re.findall(r'(G{3,}\w{1,7}){3,}G{3,}', seq))
-
-def detect_z_dna(seq):
-    return len(re.findall(r'(CG){6,}', seq))
-
-def reverse_complement(seq):
-    complement = str.maketrans('ATGCatgc', 'TACGtacg')
-    return seq.translate(complement)[::-1]
-
-def detect_cruciform(seq, min_len=4, max_len=6, spacer=10):
-    count = 0
-    seq = seq.upper()
-    for size in range(min_len, max_len + 1):
-        for i in range(len(seq) - 2 * size - spacer + 1):
-            left = seq[i:i+size]
-            right = seq[i+size+spacer:i+2*size+spacer]
-            if reverse_complement(left) == right:
-                count += 1
-    return count
-
-def detect_tata_box(seq):
-    return len(re.findall(r'TATA[AT]A[AT]', seq))
-
-def detect_direct_repeats(seq):
-    return len(re.findall(r'(.{3,6})\1+', seq))
-
-def extract_features(seq):
-    seq = seq.upper()
-    return {
-        'Perplexity': calculate_perplexity(seq),
-        'G-Quadruplex': detect_g_quadruplex(seq),
-        'Z-DNA': detect_z_dna(seq),
-        'Cruciform': detect_cruciform(seq),
-        'TATA-Box': detect_tata_box(seq),
-        'Direct Repeats': detect_direct_repeats(seq),
-        'Sequence Length': len(seq)
-    }
+# ------------------------- FASTA PARSING --------------------------
+def iter_fasta(fileobj):
+    fileobj.seek(0)
+    text = io.TextIOWrapper(fileobj, encoding="utf-8")
+    current = []
+    try:
+        for raw in text:
+            line = raw.strip()
+            if not line:
+                continue
+            if line.startswith(">"):
+                if current:
+                    yield encode_sequence("".join(current))
+                current = []
+            else:
+                current.append(line)
+        if current:
+            yield encode_sequence("".join(current))
+    finally:
+        # Don't let the wrapper close the uploaded file when it is collected
+        text.detach()
+
+# ------------------------- ANALYSIS --------------------------
+@st.cache_data(show_spinner=False, max_entries=8)
+def analyze(file_bytes):
+    # Keyed on the uploaded bytes, so reruns from widget interactions reuse the result
+    records = list(iter_fasta(io.BytesIO(file_bytes)))
+    table, errors = extract_all_features(records)
+
+    df = pd.DataFrame(table)
+
+    # No trained model yet: fitting on all-zero labels could only ever predict 0
+    df["Prediction"] = 0
+    return df, len(records), [error for _, error in errors]
 
 # ------------------------- PAGES --------------------------
 
@@ -193,44 +253,20 @@ elif page == "📂 Upload & Analyze":
         st.stop()
 
     st.markdown("## 📂 Upload & Analyze DNA Sequences")
-    uploaded_file = st.file_uploader("📄 Upload a `.txt`, `.fna`, or `.fasta` file with sequences", type=["txt", "fna", "fasta"])
+    # Inside a form, picking a file or any other widget change doesn't rerun the
+    # analysis (or log it again); only the submit button does
+    with st.form("analyze"):
+        uploaded_file = st.file_uploader("📄 Upload a `.txt`, `.fna`, or `.fasta` file with sequences", type=["txt", "fna", "fasta"])
+        submitted = st.form_submit_button("🔬 Analyze")
 
-    if uploaded_file:
+    if submitted and uploaded_file:
         st.success(f"📁 File uploaded: `{uploaded_file.name}`")
-        content = uploaded_file.read().decode("utf-8").strip().splitlines()
-        records = []
-        current_seq = []
-
-        for line in content:
-            line = line.strip()
-            if not line:
-                continue
-            if line.startswith(">"):
-                if current_seq:
-                    records.append("".join(current_seq))
-                current_seq = []
-            else:
-                current_seq.append(line)
-
-        if current_seq:
-            records.append("".join(current_seq))
-
-        st.info(f"🔍 Found {len(records)} sequences")
 
         with st.spinner("🔬 Analyzing sequences..."):
-            feature_rows = []
-            for sequence in records:
-                try:
-                    features = extract_features(sequence)
-                    feature_rows.append(features)
-                except Exception as e:
-                    st.error(f"Error processing a sequence: {e}")
-
-            df = pd.DataFrame(feature_rows)
-
-            clf = RandomForestClassifier()
-            clf.fit(df, [0]*len(df))
-            df["Prediction"] = clf.predict(df)
+            df, record_count, errors = analyze(uploaded_file.getvalue())
+            st.info(f"🔍 Found {record_count} sequences")
+            for error in errors:
+                st.error(f"Error processing a sequence: {error}")
 
             st.session_state["results_df"] = df
 
@@ -1,8 +1,5 @@
 import streamlit as st
-import pandas as pd
-import re
-import math
-from sklearn.ensemble import RandomForestClassifier
+from dna_features import analyze
 
 # ------------------------- PAGE CONFIG --------------------------
 st.set_page_config(
@@ -38,55 +35,6 @@ st.markdown("""
 st.sidebar.title("🧭 Navigation")
 page = st.sidebar.radio("Choose Page", ["🏠 Home", "📂 Upload & Analyze", "📊 Results", "📥 Download Report", "📞 Contact"])
 
-# ------------------------- HELPER FUNCTIONS --------------------------
-
-def calculate_perplexity(sequence, k=3):
-    kmers = [sequence[i:i + k] for i in range(len(sequence) - k + 1)]
-    kmer_counts = pd.Series(kmers).value_counts()
-    total = sum(kmer_counts)
-    probs = kmer_counts / total
-    entropy = -sum(p * math.log2(p) for p in probs)
-    return 2 ** entropy
-
-def detect_g_quadruplex(seq):
-    return len(re.findall(r'(G{3,}\w{1,7}){3,}G{3,}', seq))
-
-def detect_z_dna(seq):
-    return len(re.findall(r'(CG){6,}', seq))
-
-def reverse_complement(seq):
-    complement = str.maketrans('ATGCatgc', 'TACGtacg')
-    return seq.translate(complement)[::-1]
-
-def detect_cruciform(seq, min_len=4, max_len=6, spacer=10):
-    count = 0
-    seq = seq.upper()
-    for size in range(min_len, max_len + 1):
-        for i in range(len(seq) - 2 * size - spacer + 1):
-            left = seq[i:i+size]
-            right = seq[i+size+spacer:i+2*size+spacer]
-            if reverse_complement(left) == right:
-                count += 1
-    return count
-
-def detect_tata_box(seq):
-    return len(re.findall(r'TATA[AT]A[AT]', seq))
-
-def detect_direct_repeats(seq):
-    return len(re.findall(r'(.{3,6})\1+', seq))
-
-def extract_features(seq):
-    seq = seq.upper()
-    return {
-        'Perplexity': calculate_perplexity(seq),
-        'G-Quadruplex': detect_g_quadruplex(seq),
-        'Z-DNA': detect_z_dna(seq),
-        'Cruciform': detect_cruciform(seq),
-        'TATA-Box': detect_tata_box(seq),
-        'Direct Repeats': detect_direct_repeats(seq),
-        'Sequence Length': len(seq)
-    }
-
 # ------------------------- PAGES --------------------------
 
 if page == "🏠 Home":
@@ -107,39 +55,19 @@ if page == "🏠 Home":
 elif page == "📂 Upload & Analyze":
     st.markdown("## 📂 Upload & Analyze DNA Sequences")
 
-    uploaded_file = st.file_uploader("📄 Upload a `.txt` file with sequences (one per line)", type=["txt"])
+    # Inside a form, picking a file or any other widget change doesn't rerun the
+    # analysis; only the submit button does
+    with st.form("analyze"):
+        uploaded_file = st.file_uploader("📄 Upload a `.txt` file with sequences (one per line)", type=["txt"])
+        submitted = st.form_submit_button("🔬 Analyze")
 
-    if uploaded_file:
+    if submitted and uploaded_file:
         st.success(f"📁 File uploaded: `{uploaded_file.name}`")
 
-        content = uploaded_file.read().decode("utf-8").strip().splitlines()
-        records = []
-        for i, line in enumerate(content):
-            line = line.strip()
-            if not line:
-                continue
-            parts = line.split()
-            seq_id = parts[0]
-            sequence = "".join(parts[1:]) if len(parts) > 1 else parts[0]
-            records.append((seq_id, sequence))
-
         with st.spinner("🔍 Extracting features..."):
-            feature_rows = []
-            for seq_id, sequence in records:
-                try:
-                    features = extract_features(sequence)
-                    features["ID"] = seq_id
-                    feature_rows.append(features)
-                except Exception as e:
-                    st.error(f"Error processing {seq_id}: {e}")
-
-            df = pd.DataFrame(feature_rows)
-            df = df[["ID"] + [col for col in df.columns if col != "ID"]]  # Reorder
-
-            # Dummy ML prediction
-            clf = RandomForestClassifier()
-            clf.fit(df.drop(columns=["ID"]), [0]*len(df))
-            df["Prediction"] = clf.predict(df.drop(columns=["ID"]))
+            df, errors = analyze(uploaded_file.getvalue())
+            for seq_id, error in errors:
+                st.error(f"Error processing {seq_id}: {error}")
 
             st.session_state["results_df"] = df
             st.success("✅ Analysis complete! Check the 📊 Results tab.")
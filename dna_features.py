@@ -0,0 +1,460 @@
+import streamlit as st
+import numpy as np
+import re
+import math
+import threading
+import hashlib
+import os
+import functools
+import io
+import pandas as pd
+from bisect import bisect_right
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from numpy.lib.stride_tricks import sliding_window_view
+
+try:
+    import hyperscan
+except ImportError:
+    hyperscan = None
+
+try:
+    import re2
+except ImportError:
+    re2 = None
+
+# Detectors take the upper-cased ASCII bytes of a sequence (see feature_row), so the
+# patterns are bytes patterns and run on re's byte path
+_G4_RE = re.compile(rb'(G{3,}[ACGTN]{1,7}){3,}G{3,}')
+# Only counted, so the group can be dropped; that keeps RE2 on its DFA instead of the
+# much slower submatch engine, e.g. on long poly-G runs
+_G4_COUNT_RE = (re2 or re).compile(rb'(?:G{3,}[ACGTN]{1,7}){3,}G{3,}')
+_ZDNA_RE = re.compile(rb'(CG){6,}')
+_TATA_RE = re.compile(rb'TATA[AT]A[AT]')
+_DR_RE = re.compile(rb'(.{3,6})\1+', re.DOTALL)
+
+# Hyperscan reports every match end rather than re.findall's non-overlapping
+# matches, and has no backreferences. G-quadruplex and Z-DNA only get a
+# presence check from it so their regexes can be skipped; TATA boxes have a
+# fixed length, so their non-overlapping count can be taken straight from the
+# ordered match ends. Direct repeats need a backreference, which it (like RE2) lacks.
+_G4_ID, _ZDNA_ID, _TATA_ID = range(3)
+_TATA_LEN = 7
+_hs_local = threading.local()
+
+# The compiled databases and Numba kernels are looked up for every sequence, so they are
+# memoized per process rather than through st.cache_resource, whose lookup costs more
+# than a short read's features; forked pool workers inherit them already loaded
+@functools.lru_cache(maxsize=None)
+def _motif_db(batched=False):
+    if hyperscan is None:
+        return None
+    # A batched scan covers many sequences, so a single match for the whole buffer
+    # can't tell which of them contain a motif
+    presence = 0 if batched else hyperscan.HS_FLAG_SINGLEMATCH
+    db = hyperscan.Database()
+    db.compile(
+        expressions=[_G4_RE.pattern, _ZDNA_RE.pattern, _TATA_RE.pattern],
+        ids=[_G4_ID, _ZDNA_ID, _TATA_ID],
+        flags=[presence, presence, 0],
+    )
+    return db
+
+def _hs_scratch(db):
+    # Scratch space is per thread and per database
+    scratches = _hs_local.__dict__.setdefault("scratches", {})
+    if id(db) not in scratches:
+        scratches[id(db)] = hyperscan.Scratch(db)
+    return scratches[id(db)]
+
+def scan_motifs(data, db=None):
+    # Returns (has_g4, has_z_dna, tata_count); without Hyperscan every motif counts as present
+    if db is None:
+        db = _motif_db()
+    if db is None:
+        return True, True, detect_tata_box(data)
+    present = [False, False]
+    tata = [0, 0]  # count, end of the last counted match
+
+    def on_match(motif_id, start, end, flags, context):
+        if motif_id == _TATA_ID:
+            if end - _TATA_LEN >= tata[1]:
+                tata[0] += 1
+                tata[1] = end
+        else:
+            present[motif_id] = True
+
+    db.scan(data, match_event_handler=on_match, scratch=_hs_scratch(db))
+    return present[0], present[1], tata[0]
+
+# Without single-match reporting a G-rich sequence can fire a G4 match at almost
+# every base, so only short sequences, where the per-call overhead dominates, are batched
+MOTIF_BATCH_MAX_LEN = 1_000
+
+def scan_motifs_batch(datas):
+    # scan_motifs for each of datas, with the short ones joined into one Hyperscan call
+    db = _motif_db(batched=True)
+    short = [i for i, data in enumerate(datas) if len(data) < MOTIF_BATCH_MAX_LEN]
+    single = _motif_db()
+    if db is None or len(short) < 2:
+        return [scan_motifs(data, single) for data in datas]
+    # No motif can match across a newline, and each match is attributed to the
+    # sequence its last base falls in
+    starts = []
+    offset = 0
+    for i in short:
+        starts.append(offset)
+        offset += len(datas[i]) + 1
+    found = [[False, False, 0, 0] for _ in short]  # has_g4, has_z_dna, tata count, end of last counted TATA
+    # Matches arrive in order of their end, mostly several in a row for one sequence
+    current = [0, len(datas[short[0]])]  # index into found, end of that sequence in the joined buffer
+
+    def on_match(motif_id, start, end, flags, context):
+        if not starts[current[0]] < end <= current[1]:
+            current[0] = bisect_right(starts, end - 1) - 1
+            current[1] = starts[current[0] + 1] - 1 if current[0] + 1 < len(starts) else offset - 1
+        state = found[current[0]]
+        if motif_id == _TATA_ID:
+            if end - _TATA_LEN >= state[3]:
+                state[2] += 1
+                state[3] = end
+        else:
+            state[motif_id] = True
+
+    db.scan(b"\n".join(datas[i] for i in short), match_event_handler=on_match, scratch=_hs_scratch(db))
+    results = [None] * len(datas)
+    for i, state in zip(short, found):
+        results[i] = tuple(state[:3])
+    return [scan_motifs(data, single) if result is None else result for data, result in zip(datas, results)]
+
+_BASE_TABLE = bytes(b'ACGT'.index(c) if c in b'ACGT' else 255 for c in range(256))
+
+def base_codes(data):
+    # 2-bit codes for the Numba kernels, or None when data holds anything besides ACGT
+    codes = data.translate(_BASE_TABLE)
+    return None if 255 in codes else np.frombuffer(codes, dtype=np.uint8)
+
+def _kmer_perplexity(codes, k):
+    total = codes.shape[0] - k + 1
+    hist = np.zeros(4 ** k, np.int64)
+    mask = (1 << (2 * k)) - 1
+    idx = 0
+    for i in range(codes.shape[0]):
+        idx = ((idx << 2) | codes[i]) & mask
+        if i >= k - 1:
+            hist[idx] += 1
+    # H = log2(n) - sum(c * log2(c)) / n, straight from the raw counts
+    weighted = 0.0
+    for h in hist:
+        if h:
+            weighted += h * np.log2(h)
+    return 2.0 ** (np.log2(total) - weighted / total)
+
+def _cruciform_count(codes, min_len, max_len, spacer):
+    # Rolling 2-bit ids of every window and of its reverse complement, so each
+    # stem comparison is a single integer compare
+    n = codes.shape[0]
+    count = 0
+    for size in range(min_len, max_len + 1):
+        windows = n - size + 1
+        if windows <= 0:
+            continue
+        mask = (1 << (2 * size)) - 1
+        shift = 2 * (size - 1)
+        fwd = np.empty(windows, np.int64)
+        rc = np.empty(windows, np.int64)
+        f = 0
+        r = 0
+        for i in range(n):
+            c = codes[i]
+            f = ((f << 2) | c) & mask
+            r = (r >> 2) | ((3 - c) << shift)
+            if i >= size - 1:
+                fwd[i - size + 1] = f
+                rc[i - size + 1] = r
+        gap = size + spacer
+        for i in range(n - 2 * size - spacer + 1):
+            if rc[i] == fwd[i + gap]:
+                count += 1
+    return count
+
+def _direct_repeat_count(arr, min_period, max_period):
+    # The matches re.findall(rb'(.{3,6})\1+', ...) counts, without backtracking: at each
+    # start the longest period wins, then the repeat runs for as many whole copies as fit
+    n = arr.shape[0]
+    count = 0
+    i = 0
+    while i < n:
+        step = 1
+        for p in range(max_period, min_period - 1, -1):
+            run = 0
+            while i + run + p < n and arr[i + run] == arr[i + run + p]:
+                run += 1
+            if run >= p:
+                count += 1
+                step = p + p * (run // p)
+                break
+        i += step
+    return count
+
+# Memoized per process like _motif_db
+@functools.lru_cache(maxsize=None)
+def _jit_kernels():
+    # numba takes a while to import, so only load it once a sequence is analyzed
+    try:
+        from numba import njit
+    except ImportError:
+        return None
+    perplexity = njit(cache=True)(_kmer_perplexity)
+    cruciform = njit(cache=True)(_cruciform_count)
+    direct_repeats = njit(cache=True)(_direct_repeat_count)
+    # Compile on a dummy 100 bp sequence now, so it happens once in this process
+    # rather than in every forked worker. Real inputs are read-only views of bytes,
+    # which numba compiles separately from writable arrays.
+    dummy = np.frombuffer(bytes(100), dtype=np.uint8)
+    perplexity(dummy, 3)
+    cruciform(dummy, 4, 6, 10)
+    direct_repeats(dummy, 3, 6)
+    return perplexity, cruciform, direct_repeats
+
+KMER_HISTOGRAM_MAX_BINS = 1 << 20
+
+def calculate_perplexity(data, k=3, codes=None, kernels=None):
+    if kernels is None:
+        kernels = _jit_kernels()
+    if kernels is not None and len(data) >= k:
+        # Only pure ACGT fits the 2-bit encoding; anything else takes the generic path
+        if codes is None:
+            codes = base_codes(data)
+        if codes is not None:
+            return kernels[0](codes, k)
+    total = len(data) - k + 1
+    if total <= 0:
+        return 1.0
+    # Number each k-mer in base `alphabet` over the bytes that actually occur, then
+    # histogram the numbers; too many possible k-mers for a histogram means sorting them
+    arr = np.frombuffer(data, dtype=np.uint8)
+    present = np.bincount(arr, minlength=256) > 0
+    alphabet = int(present.sum())
+    codes = (np.cumsum(present) - 1)[arr]  # dense codes from a lookup table, no sort
+    windows = sliding_window_view(codes, k)
+    if alphabet ** k <= KMER_HISTOGRAM_MAX_BINS:
+        counts = np.bincount(windows @ (alphabet ** np.arange(k, dtype=np.int64)))
+        counts = counts[counts > 0]
+    else:
+        counts = np.unique(windows, axis=0, return_counts=True)[1]
+    return 2 ** (math.log2(total) - float((counts * np.log2(counts)).sum()) / total)
+
+def detect_g_quadruplex(data):
+    return len(_G4_COUNT_RE.findall(data))
+
+ZDNA_MIN_REPEATS = 6
+# The CG bitmap only beats the regex from about 1 kb
+ZDNA_VECTOR_MIN_LEN = 1024
+
+def _count_runs(mask, min_len):
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], mask.view(np.int8), [0]))))
+    return int(((edges[1::2] - edges[::2]) >= min_len).sum())
+
+def detect_z_dna(data):
+    if len(data) < ZDNA_VECTOR_MIN_LEN:
+        return len(_ZDNA_RE.findall(data))
+    # (CG){6,} matches each maximal chain of >= 6 back-to-back CG steps once,
+    # and chains on even and odd offsets can never overlap
+    arr = np.frombuffer(data, dtype=np.uint8)
+    cg = (arr[:-1] == ord('C')) & (arr[1:] == ord('G'))
+    return _count_runs(cg[0::2], ZDNA_MIN_REPEATS) + _count_runs(cg[1::2], ZDNA_MIN_REPEATS)
+
+_RC_TABLE = bytes.maketrans(b'ATGCatgc', b'TACGtacg')
+
+_COMPLEMENT_LUT = np.frombuffer(_RC_TABLE, dtype=np.uint8)
+
+def detect_cruciform(data, min_len=4, max_len=6, spacer=10, codes=None, kernels=None):
+    if kernels is None:
+        kernels = _jit_kernels()
+    if kernels is not None:
+        if codes is None:
+            codes = base_codes(data)
+        if codes is not None:
+            return kernels[1](codes, min_len, max_len, spacer)
+    arr = np.frombuffer(data, dtype=np.uint8)
+    count = 0
+    for size in range(min_len, max_len + 1):
+        n = len(arr) - 2 * size - spacer + 1
+        if n <= 0:
+            continue
+        windows = sliding_window_view(arr, size)
+        left = windows[:n]
+        right_rc = _COMPLEMENT_LUT[windows[size + spacer:size + spacer + n, ::-1]]
+        count += int((left == right_rc).all(axis=1).sum())
+    return count
+
+# Below about 10 kb the regex is faster than building the masks
+TATA_VECTOR_MIN_LEN = 10_000
+
+def detect_tata_box(data):
+    if len(data) < TATA_VECTOR_MIN_LEN:
+        return len(_TATA_RE.findall(data))
+    arr = np.frombuffer(data, dtype=np.uint8)
+    n = len(arr) - _TATA_LEN + 1
+    a = arr == ord('A')
+    t = arr == ord('T')
+    at = a | t
+    starts = np.flatnonzero(t[:n] & a[1:n + 1] & t[2:n + 2] & a[3:n + 3] & at[4:n + 4] & a[5:n + 5] & at[6:])
+    # findall only counts non-overlapping boxes, taking the leftmost of each overlapping chain
+    count = 0
+    next_free = 0
+    for start in starts.tolist():
+        if start >= next_free:
+            count += 1
+            next_free = start + _TATA_LEN
+    return count
+
+DR_MIN_PERIOD, DR_MAX_PERIOD = 3, 6
+
+def detect_direct_repeats(data, kernels=None):
+    if kernels is None:
+        kernels = _jit_kernels()
+    if kernels is not None:
+        return kernels[2](np.frombuffer(data, dtype=np.uint8), DR_MIN_PERIOD, DR_MAX_PERIOD)
+    return len(_DR_RE.findall(data))
+
+FEATURE_DTYPE = np.dtype([
+    ('Perplexity', 'f8'),
+    ('G-Quadruplex', 'i4'),
+    ('Z-DNA', 'i4'),
+    ('Cruciform', 'i4'),
+    ('TATA-Box', 'i4'),
+    ('Direct Repeats', 'i4'),
+    ('Sequence Length', 'i4'),
+])
+
+def encode_sequence(seq):
+    return seq.encode('ascii', 'replace')
+
+def sequence_bytes(seq):
+    # seq may be a str or already-encoded bytes; either way it is encoded and upper-cased
+    return (encode_sequence(seq) if isinstance(seq, str) else bytes(seq)).upper()
+
+def feature_row(seq, motifs=None):
+    # One FEATURE_DTYPE record, in field order. Every detector reads the one sequence_bytes
+    # buffer, and the Numba kernels share one 2-bit encoding of it; motifs is scan_motifs'
+    # result for it when the caller has already scanned.
+    data = sequence_bytes(seq)
+    kernels = _jit_kernels()
+    codes = base_codes(data) if kernels is not None else None
+    has_g4, has_z_dna, tata_count = scan_motifs(data) if motifs is None else motifs
+    return (
+        calculate_perplexity(data, codes=codes, kernels=kernels),
+        detect_g_quadruplex(data) if has_g4 else 0,
+        detect_z_dna(data) if has_z_dna else 0,
+        detect_cruciform(data, codes=codes, kernels=kernels),
+        tata_count,
+        detect_direct_repeats(data, kernels),
+        len(data),
+    )
+
+def extract_features(seq):
+    return dict(zip(FEATURE_DTYPE.names, feature_row(seq)))
+
+# Forking a pool only pays off with several CPUs and a lot of sequence in total;
+# many short records are still cheaper to run serially than to fork for
+PARALLEL_MIN_BASES = 1_000_000
+
+def _try_feature_row(data, motifs):
+    try:
+        return feature_row(data, motifs), None
+    except Exception as e:
+        return None, str(e)
+
+def _try_feature_rows(datas, motifs):
+    return list(map(_try_feature_row, datas, motifs))
+
+def _feature_rows(sequences):
+    datas = [sequence_bytes(seq) for seq in sequences]
+    motifs = scan_motifs_batch(datas)
+    total_bases = sum(len(data) for data in datas)
+    workers = os.cpu_count() or 1
+    if workers <= 1 or len(datas) < 2 or total_bases < PARALLEL_MIN_BASES:
+        yield from map(_try_feature_row, datas, motifs)
+        return
+    # Cut the records into consecutive batches of about equal total length rather than
+    # equal count, so a batch of long records doesn't keep one worker busy after the rest
+    batches = 4 * workers
+    ends = np.cumsum([len(data) for data in datas])
+    cuts = np.searchsorted(ends, total_bases * np.arange(1, batches) / batches, side="right")
+    bounds = np.unique(np.concatenate(([0], cuts, [len(datas)]))).tolist()
+    _jit_kernels()  # forked workers inherit the compiled kernels
+    with ProcessPoolExecutor(max_workers=workers) as ex:
+        for rows in ex.map(_try_feature_rows,
+                           [datas[a:b] for a, b in zip(bounds, bounds[1:])],
+                           [motifs[a:b] for a, b in zip(bounds, bounds[1:])]):
+            yield from rows
+
+FEATURE_CACHE_SIZE = 4096
+
+@st.cache_resource
+def _feature_cache():
+    # fingerprint -> feature row, least recently used first; shared by all sessions
+    return OrderedDict(), threading.Lock()
+
+def sequence_fingerprint(seq):
+    data = seq.encode() if isinstance(seq, str) else bytes(seq)
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+def _store_row(columns, i, row):
+    for column, value in zip(columns.values(), row):
+        column[i] = value
+
+def extract_all_features(sequences):
+    # Returns {feature name: column array} for the sequences that succeeded, plus (index, message) for the rest
+    columns = {name: np.empty(len(sequences), FEATURE_DTYPE[name]) for name in FEATURE_DTYPE.names}
+    ok = np.ones(len(sequences), dtype=bool)
+    errors = []
+    cache, lock = _feature_cache()
+    keys = [sequence_fingerprint(seq) for seq in sequences]
+    misses = []
+    with lock:
+        for i, key in enumerate(keys):
+            row = cache.get(key)
+            if row is None:
+                misses.append(i)
+            else:
+                cache.move_to_end(key)
+                _store_row(columns, i, row)
+    # Only sequences that haven't been seen before are sent to the workers
+    for i, (row, error) in zip(misses, _feature_rows([sequences[i] for i in misses])):
+        if error is None:
+            _store_row(columns, i, row)
+            with lock:
+                cache[keys[i]] = row
+                if len(cache) > FEATURE_CACHE_SIZE:
+                    cache.popitem(last=False)
+        else:
+            ok[i] = False
+            errors.append((i, error))
+    return {name: column[ok] for name, column in columns.items()}, errors
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def analyze(file_bytes):
+    # One record per line, "ID SEQUENCE" or a bare sequence; shared by the t.py and code.py pages.
+    # Keyed on the uploaded bytes, so reruns from widget interactions reuse the result
+    ids = []
+    sequences = []
+    # Lines are read one at a time instead of decoding the whole file and listing its lines;
+    # split() already drops surrounding whitespace and yields nothing for blank lines
+    for parts in map(str.split, io.TextIOWrapper(io.BytesIO(file_bytes), encoding="utf-8")):
+        if parts:
+            # A bare sequence is its own ID
+            ids.append(parts[0])
+            sequences.append("".join(parts[1:]) or parts[0])
+
+    table, errors = extract_all_features(sequences)
+    failed = {i for i, _ in errors}
+
+    df = pd.DataFrame(table)
+    df.insert(0, "ID", [seq_id for i, seq_id in enumerate(ids) if i not in failed])
+
+    # No trained model yet: fitting on all-zero labels could only ever predict 0
+    df["Prediction"] = 0
+    return df, [(ids[i], error) for i, error in errors]
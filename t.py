@@ -1,10 +1,9 @@
 import streamlit as st
 import pandas as pd
-import re
-import math
 import hashlib
+import hmac
 import os
-from sklearn.ensemble import RandomForestClassifier
+from dna_features import analyze
 
 # ------------------------- PAGE CONFIG --------------------------
 st.set_page_config(
@@ -35,26 +34,45 @@ st.markdown("""
 # ------------------------- AUTHENTICATION --------------------------
 USER_FILE = "users.csv"
 
-def hash_password(password):
-    return hashlib.sha256(password.encode()).hexdigest()
+PBKDF2_ITERATIONS = 200_000
+
+def hash_password(password, salt=None, iterations=PBKDF2_ITERATIONS):
+    if salt is None:
+        salt = os.urandom(16)
+    digest = hashlib.pbkdf2_hmac("sha256", password.encode(), salt, iterations)
+    return f"pbkdf2_sha256${iterations}${salt.hex()}${digest.hex()}"
+
+def verify_password(password, stored):
+    if stored.startswith("pbkdf2_sha256$"):
+        _, iterations, salt, _ = stored.split("$")
+        candidate = hash_password(password, bytes.fromhex(salt), int(iterations))
+    else:
+        # Accounts registered before salted hashes were introduced
+        candidate = hashlib.sha256(password.encode()).hexdigest()
+    return hmac.compare_digest(candidate, stored)
+
+# Only the newest version of the file is ever asked for again
+@st.cache_data(max_entries=2)
+def _read_users(version):
+    df = pd.read_csv(USER_FILE, usecols=["username", "password"], dtype="string", engine="pyarrow")
+    return dict(zip(df.username, df.password))
 
 def load_users():
     if not os.path.exists(USER_FILE):
         return {}
-    df = pd.read_csv(USER_FILE)
-    return dict(zip(df.username, df.password))
+    # Appends always grow the file, so (mtime, size) changes with every registration
+    # even when two land within the same mtime tick
+    stat = os.stat(USER_FILE)
+    return _read_users((stat.st_mtime_ns, stat.st_size))
 
 def save_user(username, password):
     hashed = hash_password(password)
-    if os.path.exists(USER_FILE):
-        df = pd.read_csv(USER_FILE)
-        df = pd.concat([df, pd.DataFrame({"username": [username], "password": [hashed]})])
-    else:
-        df = pd.DataFrame({"username": [username], "password": [hashed]})
-    df.to_csv(USER_FILE, index=False)
+    df = pd.DataFrame({"username": [username], "password": [hashed]})
+    df.to_csv(USER_FILE, mode="a", header=not os.path.exists(USER_FILE), index=False)
 
 def authenticate(username, password, users):
-    return users.get(username) == hash_password(password)
+    stored = users.get(username)
+    return isinstance(stored, str) and verify_password(password, stored)
 
 # ------------------------- SIDEBAR NAVIGATION --------------------------
 if "logged_in" not in st.session_state:
@@ -65,54 +83,6 @@ if not st.session_state.logged_in:
 else:
     page = st.sidebar.radio("Choose Page", ["🏠 Home", "📂 Upload & Analyze", "📊 Results", "📥 Download Report", "📞 Contact", "🚪 Logout"])
 
-# ------------------------- HELPER FUNCTIONS --------------------------
-def calculate_perplexity(sequence, k=3):
-    kmers = [sequence[i:i + k] for i in range(len(sequence) - k + 1)]
-    kmer_counts = pd.Series(kmers).value_counts()
-    total = sum(kmer_counts)
-    probs = kmer_counts / total
-    entropy = -sum(p * math.log2(p) for p in probs)
-    return 2 ** entropy
-
-def detect_g_quadruplex(seq):
-    return len(re.findall(r'(G{3,}\w{1,7}){3,}G{3,}', seq))
-
-def detect_z_dna(seq):
-    return len(re.findall(r'(CG){6,}', seq))
-
-def reverse_complement(seq):
-    complement = str.maketrans('ATGCatgc', 'TACGtacg')
-    return seq.translate(complement)[::-1]
-
-def detect_cruciform(seq, min_len=4, max_len=6, spacer=10):
-    count = 0
-    seq = seq.upper()
-    for size in range(min_len, max_len + 1):
-        for i in range(len(seq) - 2 * size - spacer + 1):
-            left = seq[i:i+size]
-            right = seq[i+size+spacer:i+2*size+spacer]
-            if reverse_complement(left) == right:
-                count += 1
-    return count
-
-def detect_tata_box(seq):
-    return len(re.findall(r'TATA[AT]A[AT]', seq))
-
-def detect_direct_repeats(seq):
-    return len(re.findall(r'(.{3,6})\1+', seq))
-
-def extract_features(seq):
-    seq = seq.upper()
-    return {
-        'Perplexity': calculate_perplexity(seq),
-        'G-Quadruplex': detect_g_quadruplex(seq),
-        'Z-DNA': detect_z_dna(seq),
-        'Cruciform': detect_cruciform(seq),
-        'TATA-Box': detect_tata_box(seq),
-        'Direct Repeats': detect_direct_repeats(seq),
-        'Sequence Length': len(seq)
-    }
-
 # ------------------------- PAGES --------------------------
 
 if page == "🔐 Login":
@@ -174,39 +144,19 @@ elif page == "📂 Upload & Analyze":
         st.stop()
 
     st.markdown("## 📂 Upload & Analyze DNA Sequences")
-    uploaded_file = st.file_uploader("📄 Upload a `.txt` file with sequences (one per line)", type=["txt"])
+    # Inside a form, picking a file or any other widget change doesn't rerun the
+    # analysis; only the submit button does
+    with st.form("analyze"):
+        uploaded_file = st.file_uploader("📄 Upload a `.txt` file with sequences (one per line)", type=["txt"])
+        submitted = st.form_submit_button("🔬 Analyze")
 
-    if uploaded_file:
+    if submitted and uploaded_file:
         st.success(f"📁 File uploaded: `{uploaded_file.name}`")
 
-        content = uploaded_file.read().decode("utf-8").strip().splitlines()
-        records = []
-        for i, line in enumerate(content):
-            line = line.strip()
-            if not line:
-                continue
-            parts = line.split()
-            seq_id = parts[0]
-            sequence = "".join(parts[1:]) if len(parts) > 1 else parts[0]
-            records.append((seq_id, sequence))
-
         with st.spinner("🔍 Extracting features..."):
-            feature_rows = []
-            for seq_id, sequence in records:
-                try:
-                    features = extract_features(sequence)
-                    features["ID"] = seq_id
-                    feature_rows.append(features)
-                except Exception as e:
-                    st.error(f"Error processing {seq_id}: {e}")
-
-            df = pd.DataFrame(feature_rows)
-            df = df[["ID"] + [col for col in df.columns if col != "ID"]]  # Reorder
-
-            # Dummy ML prediction
-            clf = RandomForestClassifier()
-            clf.fit(df.drop(columns=["ID"]), [0]*len(df))
-            df["Prediction"] = clf.predict(df.drop(columns=["ID"]))
+            df, errors = analyze(uploaded_file.getvalue())
+            for seq_id, error in errors:
+                st.error(f"Error processing {seq_id}: {error}")
 
             st.session_state["results_df"] = df
             st.success("✅ Analysis complete! Check the 📊 Results tab.")